@@ -1,21 +1,33 @@
 # -*- coding:utf-8 -*-
-from __future__ import absolute_import, unicode_literals
-
+import atexit
+import base64
+import hashlib
+import io
+import json
 import os
 import posixpath
-from datetime import datetime
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urljoin
 
-import six
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured, SuspiciousOperation
 from django.core.files.base import File
 from django.core.files.storage import Storage
-from django.utils.encoding import filepath_to_uri, force_bytes, force_text
-from six.moves.urllib_parse import urljoin
+from django.utils.encoding import filepath_to_uri
 
 try:
     from qingstor.sdk.config import Config
     from qingstor.sdk.service.qingstor import QingStor
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 except ImportError:
     raise ImproperlyConfigured(
         "Could not load qingstor. "
@@ -23,29 +35,29 @@ except ImportError:
 
 
 class QingStorFile(File):
+    __slots__ = ('_storage', '_name', '_mode', 'file', '_is_dirty', '_is_read', '_size')
+
+    # Written content is kept in memory up to this size, then spilled to disk.
+    max_memory_size = 5 * 1024 * 1024
+
     def __init__(self, name, storage, mode):
         self._storage = storage
         self._name = name
         self._mode = mode
-        self.file = six.BytesIO()
+        self.file = SpooledTemporaryFile(max_size=self.max_memory_size)
         self._is_dirty = False
         self._is_read = False
+        self._size = None
 
     @property
     def size(self):
-        if self._is_dirty or self._is_read:
-            old_file_position = self.file.tell()
-            self.file.seek(0, os.SEEK_END)
-            self._size = self.file.tell()
-            self.file.seek(old_file_position, os.SEEK_SET)
-        if not hasattr(self, '_size'):
+        if self._size is None:
             self._size = self._storage.size(self._name)
         return self._size
 
     def read(self, num_bytes=None):
-        if not self._is_read:
-            content = self._storage._read(self._name)
-            self.file = six.BytesIO(content)
+        if not (self._is_read or self._is_dirty):
+            self.file, self._size = self._storage._read_file(self._name)
             self._is_read = True
 
         if num_bytes is None:
@@ -55,15 +67,20 @@ class QingStorFile(File):
         if 'b' in self._mode:
             return data
         else:
-            return force_text(data)
+            return data.decode('utf-8')
 
     def write(self, content):
         if 'w' not in self._mode:
             raise AttributeError("File was opened for read-only access.")
 
-        self.file.write(force_bytes(content))
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        if not (self._is_read or self._is_dirty):
+            # Nothing was fetched, so the buffer holds only what is written.
+            self._size = 0
+        self.file.write(content)
+        self._size = max(self._size, self.file.tell())
         self._is_dirty = True
-        self._is_read = True
 
     def close(self):
         if self._is_dirty:
@@ -72,10 +89,40 @@ class QingStorFile(File):
         self.file.close()
 
 
+def _allocate_buffer(size):
+    """
+    Return an ``io.BytesIO`` already grown to ``size`` bytes, so content can
+    be downloaded straight into its ``getbuffer()`` and is never held twice.
+    """
+    content = io.BytesIO()
+    if size:
+        content.seek(size - 1)
+        content.write(b'\0')
+        content.seek(0)
+    return content
+
+
+class _ObjectSizeChanged(IOError):
+    """
+    The object no longer has the size its cached metadata says it has.
+    """
+
+
+def _get_content_size(content):
+    size = getattr(content, 'size', None)
+    if size is None:
+        position = content.tell()
+        content.seek(0, os.SEEK_END)
+        size = content.tell() - position
+        content.seek(position, os.SEEK_SET)
+    return size
+
+
+@lru_cache(maxsize=None)
 def get_qingstor_config(name, default=None):
     config = os.environ.get(name, getattr(settings, name, default))
     if config is not None:
-        if isinstance(config, six.string_types):
+        if isinstance(config, str):
             return config.strip()
         else:
             return config
@@ -85,124 +132,488 @@ def get_qingstor_config(name, default=None):
             "variable or in setting.py" % name)
 
 
-QINGSTOR_ACCESS_KEY_ID = get_qingstor_config('QINGSTOR_ACCESS_KEY_ID')
-QINGSTOR_SECRET_ACCESS_KEY = get_qingstor_config('QINGSTOR_SECRET_ACCESS_KEY')
-QINGSTOR_BUCKET_NAME = get_qingstor_config('QINGSTOR_BUCKET_NAME')
-QINGSTOR_BUCKET_ZONE = get_qingstor_config('QINGSTOR_BUCEKT_ZONE')
-QINGSTOR_SECURE_URL = get_qingstor_config('QINGSTOR_SECURE_URL', 'True')
+# Number of hosts and connections per host kept in each client's pool.
+QINGSTOR_POOL_CONNECTIONS = 16
+QINGSTOR_POOL_MAXSIZE = 100
+
+_CLIENT_CACHE = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
+
+
+def _get_qingstor_client(access_key_id, secret_access_key):
+    """
+    Return a ``QingStor`` service client shared by every storage using the
+    same credentials, so its connection pool survives across instances.
+    """
+    cache_key = (access_key_id, secret_access_key)
+    with _CLIENT_CACHE_LOCK:
+        client = _CLIENT_CACHE.get(cache_key)
+        if client is None:
+            config = Config(access_key_id=access_key_id,
+                            secret_access_key=secret_access_key)
+            client = QingStor(config)
+            retries = Retry(total=config.connection_retries,
+                            backoff_factor=1,
+                            status_forcelist=[500, 502, 503, 504])
+            client.client.mount(config.protocol + '://',
+                                HTTPAdapter(pool_connections=QINGSTOR_POOL_CONNECTIONS,
+                                            pool_maxsize=QINGSTOR_POOL_MAXSIZE,
+                                            max_retries=retries))
+            _CLIENT_CACHE[cache_key] = client
+    return client
+
+
+# Matches anything ``posixpath.normpath`` could rewrite in a name: backslashes,
+# ``..``, repeated slashes and ``.`` segments.
+_UNCLEAN_NAME_RE = re.compile(r'\\|\.\.|//|(?:^|/)\.(?:/|$)')
+
+
+@lru_cache(maxsize=4096)
+def _cached_clean_name(name):
+    if name and not _UNCLEAN_NAME_RE.search(name):
+        return name
+
+    clean_name = posixpath.normpath(name).replace('\\', '/')
+
+    if name.endswith('/') and not clean_name.endswith('/'):
+        return clean_name + '/'
+    else:
+        return clean_name
+
+
+@lru_cache(maxsize=4096)
+def _cached_normalize_name(base_path, name):
+    final_path = urljoin(base_path + "/", name)
+
+    base_path_len = len(base_path)
+    if (not final_path.startswith(base_path) or
+            final_path[base_path_len:base_path_len + 1]
+            not in ('', '/')):
+        raise SuspiciousOperation("Attempted access to '%s' denied." %
+                                  name)
+    return final_path.lstrip('/')
+
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+_EXECUTOR_MAX_WORKERS = 16
+# Idents of the shared pool's worker threads.
+_EXECUTOR_THREADS = set()
+
+
+def _run_in_executor(fn, args):
+    _EXECUTOR_THREADS.add(threading.get_ident())
+    return fn(*args)
+
+
+def _submit(fn, *args):
+    """
+    Run ``fn(*args)`` on the thread pool shared by all QingStor storages,
+    creating it on first use. Calls made from inside the pool run inline, so
+    nested parallel work can't deadlock waiting for a free worker.
+    """
+    global _EXECUTOR
+
+    if threading.get_ident() in _EXECUTOR_THREADS:
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=_EXECUTOR_MAX_WORKERS)
+            atexit.register(_EXECUTOR.shutdown, wait=True)
+    return _EXECUTOR.submit(_run_in_executor, fn, args)
+
+
+class _StatCache(object):
+    """
+    A thread-safe LRU mapping whose entries expire ``ttl`` seconds after
+    they are stored.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every ``pop``, so a value fetched while an entry was being
+        # invalidated is not stored afterwards.
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                return None
+            if expires < time.monotonic():
+                return None
+            self._data[key] = value, expires
+            return value
+
+    def set(self, key, value, ttl=None, generation=None):
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data.pop(key, None)
+            if len(self._data) >= self.maxsize:
+                self._data.popitem(last=False)
+            self._data[key] = value, time.monotonic() + ttl
+
+    def pop(self, key):
+        with self._lock:
+            self.generation += 1
+            self._data.pop(key, None)
 
 
 class QingStorStorage(Storage):
 
     location = ""
 
+    # ``(bucket_name, bucket_zone)`` pairs already known to exist, so the
+    # bucket is only checked once per process.
+    _existing_buckets = set()
+
+    # ``_file_stat`` results shared by every instance in the process, keyed
+    # by ``(bucket_name, bucket_zone, name)``. Missing objects are only
+    # remembered for ``missing_stat_ttl`` seconds.
+    _stat_cache = _StatCache(maxsize=4096, ttl=30)
+    missing_stat_ttl = 5
+
+    # Number of keys requested per ``list_objects`` page.
+    list_objects_limit = 1000
+
+    # Files of at least ``multipart_threshold`` bytes are uploaded in
+    # ``multipart_chunksize`` parts. Each upload holds at most
+    # ``multipart_max_pending_parts`` parts in memory at once, so concurrent
+    # uploads sharing the pool can't each queue up a large read-ahead.
+    multipart_threshold = 50 * 1024 * 1024
+    multipart_chunksize = 8 * 1024 * 1024
+    multipart_max_pending_parts = 4
+
+    # Number of keys sent per ``delete_multiple_objects`` request by
+    # ``delete_many``.
+    delete_many_batch_size = 1000
+
+    # Files larger than this are downloaded with parallel ranged GETs.
+    ranged_read_threshold = 16 * 1024 * 1024
+
     def __init__(self,
-                 access_key_id=QINGSTOR_ACCESS_KEY_ID,
-                 secret_access_key=QINGSTOR_SECRET_ACCESS_KEY,
-                 bucket_name=QINGSTOR_BUCKET_NAME,
-                 bucket_zone=QINGSTOR_BUCKET_ZONE,
-                 secure_url=QINGSTOR_SECURE_URL):
-        self.config = Config(access_key_id=access_key_id, secret_access_key=secret_access_key)
+                 access_key_id=None,
+                 secret_access_key=None,
+                 bucket_name=None,
+                 bucket_zone=None,
+                 secure_url=None):
+        if access_key_id is None:
+            access_key_id = get_qingstor_config('QINGSTOR_ACCESS_KEY_ID')
+        if secret_access_key is None:
+            secret_access_key = get_qingstor_config('QINGSTOR_SECRET_ACCESS_KEY')
+        if bucket_name is None:
+            bucket_name = get_qingstor_config('QINGSTOR_BUCKET_NAME')
+        if bucket_zone is None:
+            bucket_zone = get_qingstor_config('QINGSTOR_BUCEKT_ZONE')
+        if secure_url is None:
+            secure_url = get_qingstor_config('QINGSTOR_SECURE_URL', 'True')
+
+        self.qingstor = _get_qingstor_client(access_key_id, secret_access_key)
+        self.config = self.qingstor.config
         self.bucket_name = bucket_name
         self.zone = bucket_zone
         self.bucket = self._init_bucket(bucket_name, bucket_zone)
-        self.secure_url = secure_url
+        # QINGSTOR_SECURE_URL usually comes from the environment as a string,
+        # where 'False' would otherwise be truthy.
+        self.secure_url = str(secure_url).lower() in ('1', 'true', 'yes')
+        self._base_path = self.location.rstrip('/')
+        self._url_prefix = '%s://%s.%s.%s/' % (
+            'https' if self.secure_url else 'http', bucket_name, bucket_zone, self.config.host)
 
     def _init_bucket(self, bucket_name, bucket_zone):
-        qingstor = QingStor(self.config)
-        bucket = qingstor.Bucket(bucket_name, bucket_zone)
-
-        list_bucket_output = qingstor.list_buckets()
-
-        bucket_names = []
-        for bucket_exist in list_bucket_output['buckets']:
-            bucket_names.append(bucket_exist['name'])
-        if bucket_name not in bucket_names:
-            bucket.put()
+        bucket = self.qingstor.Bucket(bucket_name, bucket_zone)
+
+        bucket_key = (bucket_name, bucket_zone)
+        if bucket_key not in self._existing_buckets:
+            status_code = bucket.head().status_code
+            if status_code == 404:
+                exists = bucket.put().ok
+            else:
+                exists = status_code == 200
+            # Only remember the bucket once it is known to exist, so a failed
+            # check or creation is retried by the next instance.
+            if exists:
+                self._existing_buckets.add(bucket_key)
         return bucket
 
     def _clean_name(self, name):
-        clean_name = posixpath.normpath(name).replace('\\', '/')
-
-        if name.endswith('/') and not clean_name.endswith('/'):
-            return clean_name + '/'
-        else:
-            return clean_name
+        return _cached_clean_name(name)
 
     def _normalize_name(self, name):
-        base_path = force_text(self.location)
-        base_path = base_path.rstrip('/')
-
-        final_path = urljoin(
-            base_path.rstrip('/') + "/", name)
-
-        base_path_len = len(base_path)
-        if (not final_path.startswith(base_path) or
-                final_path[base_path_len:base_path_len + 1]
-                not in ('', '/')):
-            raise SuspiciousOperation("Attempted access to '%s' denied." %
-                                      name)
-        return final_path.lstrip('/')
+        return _cached_normalize_name(self._base_path, name)
 
     def _open(self, name, mode='rb'):
-        return QingStorFile(self, name=name, mode=mode)
+        return QingStorFile(name, self, mode)
 
     def _put_file(self, name, content):
-        self.bucket.put_object(name, body=content)
+        size = _get_content_size(content)
+        if size >= self.multipart_threshold:
+            self._put_file_multipart(name, content)
+        elif size <= QingStorFile.max_memory_size:
+            # requests calls fileno() to size a file body, which would roll a
+            # SpooledTemporaryFile over to disk, so send small content as bytes.
+            self.bucket.put_object(name, body=content.read())
+        else:
+            self.bucket.put_object(name, body=content)
+
+    def _put_file_multipart(self, name, content):
+        upload_id = self.bucket.initiate_multipart_upload(name)['upload_id']
+        try:
+            # Bound the number of parts read into memory ahead of the uploads.
+            slots = threading.BoundedSemaphore(self.multipart_max_pending_parts)
+            futures = []
+            failed = []
+
+            def part_done(future):
+                if future.exception() is not None:
+                    failed.append(future)
+                slots.release()
+
+            # Stop reading and uploading as soon as any part has failed.
+            while not failed:
+                slots.acquire()
+                data = None if failed else content.read(self.multipart_chunksize)
+                if not data:
+                    slots.release()
+                    break
+                future = _submit(self._upload_part, name, upload_id, len(futures), data)
+                future.add_done_callback(part_done)
+                futures.append(future)
+            for future in futures:
+                future.result()
+
+            output = self.bucket.complete_multipart_upload(
+                name, upload_id=upload_id,
+                object_parts=[{'part_number': part_number} for part_number in range(len(futures))])
+            if not output.ok:
+                raise IOError("Failed to complete multipart upload of '%s' (status %d)." %
+                              (name, output.status_code))
+        except Exception:
+            self.bucket.abort_multipart_upload(name, upload_id=upload_id)
+            raise
+
+    def _upload_part(self, name, upload_id, part_number, data):
+        output = self.bucket.upload_multipart(name, upload_id=upload_id,
+                                              part_number=part_number, body=data)
+        if not output.ok:
+            raise IOError("Failed to upload part %d of '%s' (status %d)." %
+                          (part_number, name, output.status_code))
 
     def _save(self, name, content):
         cleaned_name = self._clean_name(name)
         name = self._normalize_name(cleaned_name)
 
-        self._put_file(name, content)
+        # Drop the cached metadata both before and after the upload, so a HEAD
+        # made while it runs can't leave stale data in the cache.
+        cache_key = (self.bucket_name, self.zone, name)
+        self._stat_cache.pop(cache_key)
+        try:
+            self._put_file(name, content)
+        finally:
+            self._stat_cache.pop(cache_key)
         return cleaned_name
 
-    def _read(self, name):
-        return self.bucket.get_object(name).content
+    def _read_file(self, name):
+        """
+        Download ``name`` into a new ``io.BytesIO`` and return it along with
+        the object's size.
+        """
+        size = self.size(name)
+        if size > self.ranged_read_threshold:
+            try:
+                return self._read_file_ranged(name, size), size
+            except _ObjectSizeChanged:
+                # The cached size was stale. A single GET sizes its buffer
+                # from the response itself, so it can't hit the same problem.
+                pass
+        return self._read_file_whole(name)
+
+    def _read_file_whole(self, name):
+        output = self.bucket.get_object(name)
+        try:
+            if output.status_code != 200:
+                raise IOError("Failed to read '%s' (status %d)." % (name, output.status_code))
+            size = int(output.headers['Content-Length'])
+            content = _allocate_buffer(size)
+            with content.getbuffer() as buf:
+                self._read_body(output, name, buf, 0)
+        finally:
+            output.res.close()
+        return content, size
+
+    def _read_file_ranged(self, name, size, part_size=8 * 1024 * 1024):
+        content = _allocate_buffer(size)
+        with content.getbuffer() as buf:
+            futures = [_submit(self._read_range, name, buf[start:start + part_size], start, size)
+                       for start in range(0, size, part_size)]
+            # Every part must be finished with its slice of the buffer before
+            # the buffer is released, even if one of them failed.
+            wait(futures)
+            for future in futures:
+                future.result()
+        return content
+
+    def _read_range(self, name, buf, start, total):
+        """
+        Fill ``buf`` with the range beginning at offset ``start`` of an object
+        expected to be ``total`` bytes, raising ``_ObjectSizeChanged`` if the
+        object no longer has that size.
+        """
+        end = start + len(buf) - 1
+        output = self.bucket.get_object(name, range='bytes=%d-%d' % (start, end))
+        try:
+            if output.status_code != 206:
+                raise IOError("Failed to read bytes %d-%d of '%s' (status %d)." %
+                              (start, end, name, output.status_code))
+            object_size = output.headers.get('Content-Range', '').rpartition('/')[2]
+            if (output.headers.get('Content-Length') != str(len(buf)) or
+                    object_size != str(total)):
+                self._stat_cache.pop((self.bucket_name, self.zone,
+                                      self._normalize_name(self._clean_name(name))))
+                raise _ObjectSizeChanged("Size of '%s' changed while reading it." % name)
+            self._read_body(output, name, buf, start)
+        finally:
+            output.res.close()
+
+    def _read_body(self, output, name, buf, start):
+        """
+        Read the body of the ``get_object`` response ``output`` directly into
+        ``buf``, whose first byte is at offset ``start`` of the object.
+        """
+        view = memoryview(buf)
+        offset = 0
+        while offset < len(view):
+            read = output.res.raw.readinto(view[offset:])
+            if not read:
+                raise IOError("Unexpected end of '%s' after %d bytes." %
+                              (name, start + offset))
+            offset += read
 
     def delete(self, name):
         name = self._normalize_name(self._clean_name(name))
-        if six.PY2:
-            name = name.encode('utf-8')
-        self.bucket.delete_object(name)
+        cache_key = (self.bucket_name, self.zone, name)
+        self._stat_cache.pop(cache_key)
+        try:
+            self.bucket.delete_object(name)
+        finally:
+            self._stat_cache.pop(cache_key)
+
+    def save_many(self, files):
+        """
+        Save each ``(name, content)`` pair of ``files`` concurrently and
+        return the names the files were actually saved under, in order.
+
+        Entries sharing a name are saved in successive rounds rather than
+        concurrently, so each one is given its own available name.
+        """
+        files = list(files)
+        saved_names = [None] * len(files)
+        remaining = list(range(len(files)))
+        while remaining:
+            pending, current, remaining, seen = remaining, [], [], set()
+            for i in pending:
+                key = self._normalize_name(self._clean_name(files[i][0]))
+                if key in seen:
+                    remaining.append(i)
+                else:
+                    seen.add(key)
+                    current.append(i)
+            futures = [(i, _submit(self.save, *files[i])) for i in current]
+            for i, future in futures:
+                saved_names[i] = future.result()
+        return saved_names
+
+    def delete_many(self, names):
+        """
+        Delete ``names`` with one ``delete_multiple_objects`` request per
+        ``delete_many_batch_size`` keys.
+        """
+        keys = [self._normalize_name(self._clean_name(name)) for name in names]
+
+        for i in range(0, len(keys), self.delete_many_batch_size):
+            batch = keys[i:i + self.delete_many_batch_size]
+            for key in batch:
+                self._stat_cache.pop((self.bucket_name, self.zone, key))
+            objects = [{'key': key} for key in batch]
+            body = json.dumps({'objects': objects, 'quiet': True}, sort_keys=True)
+            content_md5 = base64.b64encode(hashlib.md5(body.encode('utf-8')).digest()).decode('ascii')
+            try:
+                output = self.bucket.delete_multiple_objects(objects=objects, quiet=True,
+                                                             content_md5=content_md5)
+            finally:
+                for key in batch:
+                    self._stat_cache.pop((self.bucket_name, self.zone, key))
+            if not output.ok:
+                raise IOError("Failed to delete %d objects (status %d)." %
+                              (len(objects), output.status_code))
+            errors = output.get('errors')
+            if errors:
+                raise IOError("Failed to delete %s." % ', '.join(
+                    "'%s' (%s)" % (error.get('key'), error.get('code')) for error in errors))
 
     def _file_stat(self, name):
         name = self._normalize_name(self._clean_name(name))
-        if six.PY2:
-            name = name.encode('utf-8')
-        output = self.bucket.head_object(name)
-
-        return output.headers, output.status_code
+        cache_key = (self.bucket_name, self.zone, name)
+        stat = self._stat_cache.get(cache_key)
+        if stat is None:
+            generation = self._stat_cache.generation
+            output = self.bucket.head_object(name)
+            stat = output.headers, output.status_code
+            if output.status_code == 200:
+                self._stat_cache.set(cache_key, stat, generation=generation)
+            elif output.status_code == 404:
+                self._stat_cache.set(cache_key, stat, ttl=self.missing_stat_ttl,
+                                     generation=generation)
+        return stat
 
     def exists(self, name):
         headers, status_code = self._file_stat(name)
-        if status_code == 200:
-            return True
-        else:
-            return False
+        return status_code == 200
 
     def size(self, name):
-        output = self.bucket.list_objects(prefix=name)
-        return int(output['keys'][0]['size'])
+        headers, status_code = self._file_stat(name)
+        return int(headers['Content-Length'])
 
     def modified_time(self, name):
         headers, status_code = self._file_stat(name)
-        return datetime.strptime(headers['Last-Modified'], "%a, %d %b %Y %H:%M:%S GMT")
-
-    def listdir(self, path=""):
+        last_modified = parsedate_to_datetime(headers['Last-Modified'])
+        # Keep returning a naive UTC datetime, as strptime did.
+        if last_modified.tzinfo is not None:
+            last_modified = last_modified.astimezone(timezone.utc).replace(tzinfo=None)
+        return last_modified
+
+    def iter_listdir(self, path=""):
+        """
+        Yield the keys under ``path``, following ``next_marker`` so that
+        prefixes spanning several pages are listed in full.
+        """
         path = self._normalize_name(self._clean_name(path))
-        dirlist = self.bucket.list_objects(prefix=path)
+        marker = None
+        while True:
+            dirlist = self.bucket.list_objects(prefix=path, marker=marker,
+                                               limit=self.list_objects_limit)
+            for item in dirlist['keys']:
+                yield item['key']
+            marker = dirlist.get('next_marker')
+            if not marker:
+                break
 
-        files = []
-        for item in list(dirlist['keys']):
-            files.append(dict(item)['key'])
-        return files
+    def listdir(self, path=""):
+        return list(self.iter_listdir(path))
 
     def url(self, name):
         name = self._normalize_name(self._clean_name(name))
-        name = filepath_to_uri(name)
-        if self.secure_url:
-            protocol = 'https://'
-        else:
-            protocol = 'http://'
-        return urljoin(protocol + self.bucket_name + '.' + self.zone + '.' + self.config.host, name)
+        return self._url_prefix + filepath_to_uri(name).lstrip('/')
@@ -1,18 +1,27 @@
 # -*- coding:utf-8 -*-
-from __future__ import absolute_import, print_function, unicode_literals
-
+import io
 import logging
 import os
+import posixpath
+import sys
+import threading
 import time
 import unittest
 import uuid
 from datetime import datetime
 from os.path import join
+from unittest import mock
 
 import pytest
-import six
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+if sys.version_info < (3,):
+    pytest.skip("QingStorStorage requires Python 3", allow_module_level=True)
 
-from storages.backends.qingstor import QingStorFile, QingStorStorage
+from storages.backends.qingstor import (  # noqa: E402
+    QingStorFile, QingStorStorage, _cached_clean_name, _StatCache,
+)
 
 LOGGING_FORMAT = '\n%(levelname)s %(asctime)s %(message)s'
 logging.basicConfig(level=logging.INFO, format=LOGGING_FORMAT)
@@ -47,8 +56,8 @@ class QingStorageTest(unittest.TestCase):
 
             content = 'Hello,QingStor!'
 
-            dummy_file = six.BytesIO()
-            dummy_file.write(content)
+            dummy_file = io.BytesIO()
+            dummy_file.write(content.encode('utf-8'))
             dummy_file.seek(0, os.SEEK_END)
             file_size = dummy_file.tell()
 
@@ -79,8 +88,8 @@ class QingStorageTest(unittest.TestCase):
         for assert_file_name in ASSET_FILE_NAMES:
             REMOTE_PATH = join(UNIQUE_PATH, assert_file_name)
 
-            test_file = six.BytesIO()
-            test_file.write('Hello,QingStor!')
+            test_file = io.BytesIO()
+            test_file.write(b'Hello,QingStor!')
             test_file.seek(0)
             self.storage.save(REMOTE_PATH, test_file)
             test_file.close()
@@ -114,7 +123,7 @@ class QingStorageTest(unittest.TestCase):
 
         qingstor_file.write('Hello QingStor!')
 
-        assert qingstor_file._is_read is True
+        assert qingstor_file._is_read is False
         assert qingstor_file._is_dirty is True
 
         qingstor_file.close()
@@ -137,5 +146,304 @@ class QingStorageTest(unittest.TestCase):
 
         assert sorted(files) == sorted(filenames_join)
 
+    def test_listdir_multiple_pages(self):
+        self.storage.list_objects_limit = 2
+        filenames = [join(UNIQUE_PATH, 'pages', 'file%d' % i) for i in range(5)]
+        for filename in filenames:
+            self.storage.save(filename, io.BytesIO(b'test text'))
+
+        time.sleep(3)
+        files = self.storage.listdir(join(UNIQUE_PATH, 'pages'))
+
+        assert sorted(files) == filenames
+
+    def test_save_many_and_delete_many(self):
+        filenames = [join(UNIQUE_PATH, 'many', 'file%d' % i) for i in range(4)]
+
+        saved = self.storage.save_many(
+            (filename, io.BytesIO(b'test text')) for filename in filenames)
+
+        assert saved == filenames
+
+        time.sleep(3)
+        assert sorted(self.storage.listdir(join(UNIQUE_PATH, 'many'))) == sorted(filenames)
+
+        self.storage.delete_many(filenames)
+
+        time.sleep(3)
+        assert self.storage.listdir(join(UNIQUE_PATH, 'many')) == []
+
+    def test_save_many_duplicate_names(self):
+        filename = join(UNIQUE_PATH, 'duplicate', 'file.txt')
+
+        saved = self.storage.save_many(
+            (filename, io.BytesIO(content)) for content in (b'first', b'second', b'third'))
+
+        assert saved[0] == filename
+        assert len(set(saved)) == 3
+
+        time.sleep(3)
+        assert sorted(self.storage.listdir(join(UNIQUE_PATH, 'duplicate'))) == sorted(saved)
+
+        self.storage.delete_many(saved)
+
+    def test_url(self):
+        REMOTE_PATH = join(UNIQUE_PATH, 'url file.txt')
+
+        for secure_url, protocol in (('False', 'http'), (False, 'http'), ('True', 'https'), (True, 'https')):
+            storage = QingStorStorage(secure_url=secure_url)
+            assert storage.url(REMOTE_PATH) == '%s://%s.%s.%s/%s/url%%20file.txt' % (
+                protocol, storage.bucket_name, storage.zone, storage.config.host, UNIQUE_PATH)
+
+    @unittest.skipIf('QINGSTOR_SECURE_URL' in os.environ,
+                     "QINGSTOR_SECURE_URL overrides the default")
+    def test_url_secure_by_default(self):
+        assert self.storage.url('foo').startswith('https://')
+
     def tearDown(self):
         pass
+
+
+@pytest.mark.parametrize('name', [
+    'a', 'a/b.txt', './a', 'a/.', 'a/./b', 'a//b', 'a\\b', '../a', 'a/../b',
+    '.hidden', 'a/.hidden', '..a', '', 'a/',
+])
+def test_clean_name_matches_normpath(name):
+    clean_name = posixpath.normpath(name).replace('\\', '/')
+    if name.endswith('/') and not clean_name.endswith('/'):
+        clean_name += '/'
+
+    assert _cached_clean_name(name) == clean_name
+
+
+class MockOutput(dict):
+    """
+    Stands in for the QingStor SDK's ``Unpacker`` response.
+    """
+
+    def __init__(self, status_code=200, headers=None, content=b'', **body):
+        super(MockOutput, self).__init__(**body)
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = headers or {}
+        self.res = mock.MagicMock()
+        self.res.raw = io.BytesIO(content)
+
+
+class StatCacheTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('storages.backends.qingstor.time.monotonic', return_value=100.0)
+        self.addCleanup(patcher.stop)
+        self.monotonic = patcher.start()
+        self.cache = _StatCache(maxsize=2, ttl=30)
+
+    def test_ttl(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2, ttl=5)
+
+        self.monotonic.return_value = 110.0
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+
+        self.monotonic.return_value = 131.0
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_lru_eviction(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        # Reading 'a' makes 'b' the least recently used entry.
+        self.assertEqual(self.cache.get('a'), 1)
+        self.cache.set('c', 3)
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_set_after_pop(self):
+        generation = self.cache.generation
+        self.cache.pop('a')
+        self.cache.set('a', 1, generation=generation)
+
+        self.assertIsNone(self.cache.get('a'))
+
+
+class QingStorMockTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch('storages.backends.qingstor._get_qingstor_client')
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value.config.host = 'qingstor.com'
+        self.storage = QingStorStorage('access_key_id', 'secret_access_key', 'bucket', 'zone', 'True')
+        self.storage._stat_cache = _StatCache(maxsize=4096, ttl=30)
+        self.bucket = self.storage.bucket
+
+        # Content of the objects in the mocked bucket, keyed by name.
+        self.objects = {}
+        self.bucket.head_object.side_effect = self._head_object
+        self.bucket.get_object.side_effect = self._get_object
+
+    def _head_object(self, name):
+        if name not in self.objects:
+            return MockOutput(404)
+        return MockOutput(200, {'Content-Length': str(len(self.objects[name]))})
+
+    def _get_object(self, name, range=None):
+        if name not in self.objects:
+            return MockOutput(404)
+        content = self.objects[name]
+        if range is None:
+            return MockOutput(200, {'Content-Length': str(len(content))}, content)
+        start, end = (int(n) for n in range[len('bytes='):].split('-'))
+        end = min(end, len(content) - 1)
+        return MockOutput(206, {
+            'Content-Length': str(end - start + 1),
+            'Content-Range': 'bytes %d-%d/%d' % (start, end, len(content)),
+        }, content[start:end + 1])
+
+
+class QingStorStatCacheTests(QingStorMockTestCase):
+
+    def test_exists_after_save(self):
+        self.assertFalse(self.storage.exists('r.txt'))
+
+        def put_object(name, body=None):
+            self.objects[name] = body
+
+        self.bucket.put_object.side_effect = put_object
+        self.assertEqual(self.storage.save('r.txt', ContentFile(b'data')), 'r.txt')
+
+        self.assertTrue(self.storage.exists('r.txt'))
+        self.assertNotEqual(self.storage.get_available_name('r.txt'), 'r.txt')
+
+    def test_exists_after_save_with_concurrent_head(self):
+        """
+        A HEAD made by another thread during the upload must not leave the
+        object cached as missing.
+        """
+        def put_object(name, body=None):
+            thread = threading.Thread(target=self.storage.exists, args=(name,))
+            thread.start()
+            thread.join()
+            self.objects[name] = body
+
+        self.bucket.put_object.side_effect = put_object
+        self.assertEqual(self.storage.save('r.txt', ContentFile(b'data')), 'r.txt')
+
+        self.assertTrue(self.storage.exists('r.txt'))
+        self.assertNotEqual(self.storage.get_available_name('r.txt'), 'r.txt')
+
+    def test_exists_after_delete_with_concurrent_head(self):
+        self.objects['r.txt'] = b'data'
+        self.assertTrue(self.storage.exists('r.txt'))
+
+        def delete_object(name):
+            thread = threading.Thread(target=self.storage.exists, args=(name,))
+            thread.start()
+            thread.join()
+            del self.objects[name]
+
+        self.bucket.delete_object.side_effect = delete_object
+        self.storage.delete('r.txt')
+
+        self.assertFalse(self.storage.exists('r.txt'))
+
+
+class QingStorReadTests(QingStorMockTestCase):
+
+    def test_read_with_stale_cached_size(self):
+        self.objects['r.txt'] = b'data'
+        self.assertEqual(self.storage.size('r.txt'), 4)
+        self.objects['r.txt'] = b'new data'
+
+        with self.storage.open('r.txt') as f:
+            self.assertEqual(f.read(), b'new data')
+
+    def test_read_ranged(self):
+        self.objects['r.bin'] = content = bytes(bytearray(range(256))) * 4
+
+        buf = self.storage._read_file_ranged('r.bin', len(content), part_size=100)
+
+        self.assertEqual(buf.getvalue(), content)
+        ranges = sorted(call[1]['range'] for call in self.bucket.get_object.call_args_list)
+        self.assertEqual(ranges, sorted('bytes=%d-%d' % (start, min(start + 99, len(content) - 1))
+                                        for start in range(0, len(content), 100)))
+
+    def test_read_ranged_missing_part(self):
+        self.objects['r.bin'] = b'data'
+        self.bucket.get_object.side_effect = lambda name, range=None: MockOutput(500)
+
+        with self.assertRaises(IOError):
+            self.storage._read_file_ranged('r.bin', 4, part_size=2)
+
+    def test_read_ranged_with_stale_cached_size(self):
+        self.storage.ranged_read_threshold = 2
+        self.objects['r.txt'] = b'data'
+        self.assertEqual(self.storage.size('r.txt'), 4)
+        self.objects['r.txt'] = b'new data'
+
+        with self.storage.open('r.txt') as f:
+            self.assertEqual(f.read(), b'new data')
+
+
+class QingStorUploadTests(QingStorMockTestCase):
+    def setUp(self):
+        super(QingStorUploadTests, self).setUp()
+        self.storage.multipart_threshold = 10
+        self.storage.multipart_chunksize = 4
+        patcher = mock.patch.object(QingStorFile, 'max_memory_size', 4)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        self.bucket.put_object.return_value = MockOutput(201)
+        self.bucket.initiate_multipart_upload.return_value = MockOutput(200, upload_id='upload')
+        self.bucket.upload_multipart.return_value = MockOutput(201)
+        self.bucket.complete_multipart_upload.return_value = MockOutput(201)
+
+    def test_put_small_file_as_bytes(self):
+        self.storage.save('r.txt', ContentFile(b'data'))
+
+        self.bucket.put_object.assert_called_once_with('r.txt', body=b'data')
+        self.bucket.initiate_multipart_upload.assert_not_called()
+
+    def test_put_file_as_file(self):
+        content = ContentFile(b'more data')
+        self.storage.save('r.txt', content)
+
+        self.bucket.put_object.assert_called_once_with('r.txt', body=content)
+        self.bucket.initiate_multipart_upload.assert_not_called()
+
+    def test_put_file_multipart(self):
+        self.storage.save('r.txt', ContentFile(b'0123456789'))
+
+        self.bucket.put_object.assert_not_called()
+        self.bucket.initiate_multipart_upload.assert_called_once_with('r.txt')
+        parts = sorted(self.bucket.upload_multipart.call_args_list,
+                       key=lambda call: call[1]['part_number'])
+        self.assertEqual(parts, [
+            mock.call('r.txt', upload_id='upload', part_number=0, body=b'0123'),
+            mock.call('r.txt', upload_id='upload', part_number=1, body=b'4567'),
+            mock.call('r.txt', upload_id='upload', part_number=2, body=b'89'),
+        ])
+        self.bucket.complete_multipart_upload.assert_called_once_with(
+            'r.txt', upload_id='upload',
+            object_parts=[{'part_number': 0}, {'part_number': 1}, {'part_number': 2}])
+        self.bucket.abort_multipart_upload.assert_not_called()
+
+    def test_put_file_multipart_stops_on_failed_part(self):
+        self.storage.multipart_max_pending_parts = 1
+        self.bucket.upload_multipart.return_value = MockOutput(500)
+
+        with self.assertRaises(IOError):
+            self.storage.save('r.txt', ContentFile(b'0123456789'))
+
+        self.bucket.upload_multipart.assert_called_once_with(
+            'r.txt', upload_id='upload', part_number=0, body=b'0123')
+        self.bucket.complete_multipart_upload.assert_not_called()
+        self.bucket.abort_multipart_upload.assert_called_once_with('r.txt', upload_id='upload')
+
+    def test_put_file_multipart_aborts_on_failed_complete(self):
+        self.bucket.complete_multipart_upload.return_value = MockOutput(400)
+
+        with self.assertRaises(IOError):
+            self.storage.save('r.txt', ContentFile(b'0123456789'))
+
+        self.bucket.abort_multipart_upload.assert_called_once_with('r.txt', upload_id='upload')